@@ -6,33 +6,31 @@ much, and the dominant effect on the density of states is thermal broadening.
 """
 
 import invibro
-from invibro.common import lorentzian, linear_coupling, thermal_dist, harmonic_energies
+from invibro.common import lorentzian, linear_coupling, thermal_dist_arr, \
+    harmonic_energies_arr
 from numpy import exp, linspace
 from datetime import datetime
-import Gnuplot
+from matplotlib import pyplot
 
 invibro.dim = 8
 
 def render(xs, ys, ref, name):
-    g = Gnuplot.Gnuplot()
-    #g('set xtics 1,0.5,3')
-    g('set xrange [%s:%s]' % (xs[0], xs[-1]))
-    g('set yrange [0:%s]' % max(ys))
-    g('set size 0.6,0.6')
-    g.xlabel('E (meV)')
-    g.ylabel('A (1/meV)')
-    g.plot(
-        Gnuplot.Data(xs, ref, **{'with': 'lines lt 2 lc rgbcolor "blue" lw 2'}),
-        Gnuplot.Data(xs, ys, **{'with': 'lines lt 1 lc rgbcolor "red" lw 2'})
-    )
-    g.hardcopy(name, color=1, terminal='postscript')
+    fig, ax = pyplot.subplots(figsize=(6.0, 4.2))
+    ax.set_xlim(xs[0], xs[-1])
+    ax.set_ylim(0, max(ys))
+    ax.set_xlabel('E (meV)')
+    ax.set_ylabel('A (1/meV)')
+    ax.plot(xs, ref, '--', color='blue', lw=2)
+    ax.plot(xs, ys, '-', color='red', lw=2)
+    fig.savefig(name)
+    pyplot.close(fig)
     print("File printed to %s" % name)
 
 kelvin = 8.6173423e-5 * 1000 # 1K in meV
 n = 1
 for k in (0.6, -0.3):
     xs = linspace(-0.6, k, 2000)
-    energies = harmonic_energies(hf=0.5)
+    energies = harmonic_energies_arr(invibro.dim, hf=0.5)
     T = 5.2 * kelvin
     print("calc %s" % n); n += 1
     t0 = datetime.utcnow()
@@ -43,7 +41,7 @@ for k in (0.6, -0.3):
         ],
         'e_level': 0.0,
         'ph_energy': energies,
-        'ph_state': thermal_dist(T, energies)
+        'ph_state': thermal_dist_arr(T, energies)
     }
     ref = lorentzian(xs, calc)
     ys = invibro.density_of_states(xs, calc)
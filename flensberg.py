@@ -10,63 +10,59 @@ below instead calculate the case for Galperin, Nitzan, and Ratner's paper
 """
 
 import invibro
-from invibro.common import thermal_dist, harmonic_energies, fact
-from numpy import exp, linspace, pi
-
-def choose(n, k):
-    """Choose function, n choose k."""
-    return fact(n, n - k) / fact(k)
-
-def laguerre(n, a, x):
-    """Laguerre polynomial L_n^(a)(x) as defined on A&S p. 775."""
-    return sum(choose(n + a, n - m) * (-x) ** m / fact(m) for m in range(0, n + 1))
+from invibro.common import thermal_dist_arr, harmonic_energies_arr
+from numpy import arange, exp, indices, linspace, maximum, minimum, pi, sqrt, where
+from scipy.special import eval_genlaguerre, gammaln
 
 def displace(L):
+    """The (dim x dim) Franck-Condon matrix for a displacement L, using the
+    Laguerre polynomials L_n^(a)(x) as defined on A&S p. 775."""
     g = L ** 2
     def sgn(x):
-        return -1 if x < 0 else 1
-    def matrix(m, n, L):
-        if m > n: 
-            return matrix(n, m, -L)
-        else:
-            return (exp(-g) * g ** (n - m) * fact(m)/fact(n)) ** 0.5 * \
-                laguerre(m, n - m, g) * sgn(L) ** (n - m)
-    return lambda m, n: matrix(m, n, L)
+        return -1.0 if x < 0 else 1.0
+    m, n = indices((invibro.dim, invibro.dim))
+    lo, hi = minimum(m, n), maximum(m, n)
+    d = hi - lo
+    # below the diagonal the matrix element is that of (n, m) with L -> -L.
+    sign = where(m > n, sgn(-L), sgn(L)) ** d
+    return sqrt(exp(-g) * g ** d * exp(gammaln(lo + 1) - gammaln(hi + 1))) * \
+        eval_genlaguerre(lo, d, g) * sign
 
 w0 = 0.02 # eV
 T = 0.0258520269 # 300K in eV
 invibro.dim=8
 
-energies = harmonic_energies(0.02)
+energies = harmonic_energies_arr(invibro.dim, 0.02)
 
 q = invibro.mat_from_fn(displace(1.0))
 qbar = q.T.conjugate()
 
-rho_0 = invibro.mat_from_fn(thermal_dist(T, energies))
+rho_0 = thermal_dist_arr(T, energies)
 rho_0 /= rho_0.trace()
 rho_1 = qbar.dot(rho_0).dot(q)
 
 from datetime import datetime
-import Gnuplot
+from matplotlib import pyplot
+from matplotlib.ticker import AutoMinorLocator
 def plot(xs, ys, name, first=False):
-    g = Gnuplot.Gnuplot()
-    g('set xrange [1.88:2.08]')
-    g('set yrange [0:200]')
-    g('set xtics 1.92,0.04,2.04')
-    g('set size 0.5,0.5')
+    fig, ax = pyplot.subplots(figsize=(5.0, 3.5))
+    ax.set_xticks(arange(1.92, 2.05, 0.04))
     if first:
-        g('set ytics 0,40,320')
+        ax.set_yticks(arange(0, 321, 40))
     else:
-        g('set ytics -80,400,320')
-        g('set mytics 10')
-    g.plot(Gnuplot.Data(xs, ys / (2 * pi), **{'with': 'lines lc rgbcolor "blue" lw 3'}))
-    g.hardcopy(name, color=1, terminal='postscript')
+        ax.set_yticks(arange(-80, 321, 400))
+        ax.yaxis.set_minor_locator(AutoMinorLocator(10))
+    ax.set_xlim(1.88, 2.08)
+    ax.set_ylim(0, 200)
+    ax.plot(xs, ys / (2 * pi), '-', color='blue', lw=3)
+    fig.savefig(name)
+    pyplot.close(fig)
     print("File printed to %s" % name)
 
 matrices = (rho_0, 0.5 * rho_0 + 0.5 * rho_1, rho_1)
 fillings = (0.0, 0.5, 1.0)
 for n in range(len(matrices)):
-    print "\ncalc %i" % (n + 1);
+    print("\ncalc %i" % (n + 1))
     t0 = datetime.utcnow()
     xs = linspace(1.88, 2.08, 1000)
     ys = invibro.density_of_states(xs, {
@@ -80,4 +76,4 @@ for n in range(len(matrices)):
         'ph_state': q.dot(matrices[n])
     })
     plot(xs, ys, '/tmp/gnr_filling=%s.ps' % fillings[n], first=(n == 2))
-    print "finished in: %s" % (datetime.utcnow() - t0)
+    print("finished in: %s" % (datetime.utcnow() - t0))
@@ -9,6 +9,7 @@ prefix `smat_`, and 1xdim^2 vectors denoted by the prefix `vec_`.
 
 import invibro.make_phi
 import invibro.utils
+import multiprocessing
 import numpy
 from numpy import log, pi, exp
 
@@ -19,23 +20,35 @@ phi = invibro.make_phi.phi
 a lead."""
 class Lead:
     def __init__(self, mu, T, gamma, vib, band_size):
-        """Create a lead. parameters are chemical potential, temperature,
+        r"""Create a lead. parameters are chemical potential, temperature,
         coupling rate $\Gamma_r$, vibration matrix $f^r_{mn}$, and band width W_r."""
-        self.phi = lambda omega: \
-            (phi((omega - mu) / T, band_size / T) - log(1 - mu / (band_size + omega))) / (2 * pi)
-        self.mat_f = mat_from_fn(vib)
-        self.mat_fbar = self.mat_f.T.conjugate()
+        if mu == 0:
+            # the band-edge correction below is log(1) = 0, so skip it.
+            self.phi = lambda omega: phi(omega / T, band_size / T) / (2 * pi)
+        else:
+            self.phi = lambda omega: (phi((omega - mu) / T, band_size / T) -
+                log(1 - mu / (band_size + omega))) / (2 * pi)
+        # keep these C-contiguous complex so that their products stay on the
+        # fast BLAS paths; a bare .T.conjugate() would be Fortran-ordered.
+        self.mat_f = numpy.ascontiguousarray(mat_from_fn(vib), dtype=complex)
+        self.mat_fbar = numpy.ascontiguousarray(self.mat_f.T.conjugate())
         self.gamma = gamma
-        self.im0 = 0.5j * self.gamma * self.mat_f.dot(self.mat_fbar)
+        self.im0 = numpy.ascontiguousarray(
+            0.5j * self.gamma * self.mat_f.dot(self.mat_fbar))
 
 """The number of phonon levels currently being tracked. If this is changed, you
 should cancel all calculations and recreate the Lead objects."""
 dim = 20
 
+"""The most memory, in bytes, to spend at once on the stack of dim^2 x dim^2
+matrices that `density_of_states` hands to a single batched solve."""
+chunk_bytes = 2 ** 26
+
 """An example params dict for calculations. This is also authoritative: if you
 don't explicitly provide your own params dict, this one will be used instead."""
 params = {
     'postprocess': None,
+    'processes': 1,
     'leads': [],
     'e_level': 0.0,
     'ph_energy': lambda n: n,
@@ -46,43 +59,73 @@ def mat_from_fn(fn):
     """Produce a (dim x dim) matrix from a function which gives its indices.
 
     If this is fed a numpy array it will simply copy that array, so it is always
-    safe to run on things which 'might be' functions."""
+    safe to run on things which 'might be' functions. The function is first
+    called once on broadcastable index arrays, and only called for each index
+    pair separately if that fails."""
     if type(fn) == numpy.ndarray:
         return fn.copy()
-    else:
+    try:
+        u, v = numpy.ogrid[0:dim, 0:dim]
+        return numpy.array(numpy.broadcast_to(fn(u, v), (dim, dim)), dtype=complex)
+    except (TypeError, ValueError):
         out = numpy.zeros((dim, dim), dtype=complex)
         for u in range(0, dim):
             for v in range(0, dim):
                 out[u][v] = fn(u, v)
         return out
 
+def stack_leads(leads):
+    """Stack the matrices of a list of leads into arrays for `smat_Y`.
+
+    Since the leads do not change over a calculation, this only needs to be
+    done once for all of the omegas."""
+    return {
+        'phis': [lead.phi for lead in leads],
+        # we multiply f by phi and by gamma.
+        'mat_gfs': numpy.array([lead.gamma * lead.mat_f for lead in leads]),
+        'mat_fbars': numpy.array([lead.mat_fbar for lead in leads]),
+        'im0': sum(lead.im0 for lead in leads)
+    }
+
 def smat_Y(omega, mat_eps, leads):
-    """Calculate the self-energy tensor."""
-    cached = {}
-    out = numpy.zeros((dim**2, dim**2), dtype=complex)
-    for m in range(0, dim):
-        for n in range(0, dim):
-            e = mat_eps[m][n]
-            if e not in cached:
-                Y0, Y1 = 0.0, 0.0
-                for lead in leads:
-                    # we multiply f by phi and fbar by gamma.
-                    aug_f = lead.gamma * lead.mat_f * lead.phi(omega + mat_eps - e)
-                    Y0 -= aug_f.dot(lead.mat_fbar) + lead.im0
-                    Y1 += lead.mat_fbar.dot(aug_f)
-                cached[e] = (Y0, Y1)
-            Y = cached[e]
-            # Y[m][n][a][b] = delta[b][n] Y0[m][a] + delta[a][m] Y1[b][n]
-            for a in range(0, dim):
-                out[dim*m + n][dim*a + n] += Y[0][m][a]
-            for b in range(0, dim):
-                out[dim*m + n][dim*m + b] += Y[1][b][n]
-    return out
+    """Calculate the self-energy tensor.
+
+    If omega is an array of frequencies, this gives an array with one tensor for
+    each of them. The leads may either be a list of `Lead`s or the output of
+    `stack_leads`."""
+    if type(leads) != dict:
+        leads = stack_leads(leads)
+    ws = numpy.reshape(omega, (-1, 1, 1))
+    # mat_phis[r][w][n][k] is phi for lead r evaluated at ws[w] + mat_eps[n][k].
+    mat_phis = numpy.array([phi(ws + mat_eps) for phi in leads['phis']])
+    out = numpy.zeros((len(ws), dim**2, dim**2), dtype=complex)
+    _smat_Y_kernel(out, leads['mat_gfs'], leads['mat_fbars'], leads['im0'], mat_phis)
+    return out.reshape(numpy.shape(omega) + (dim**2, dim**2))
+
+def _smat_Y_kernel(out, mat_gfs, mat_fbars, im0, mat_phis):
+    """Add the self-energy tensors of some stacked leads into `out`.
+
+    Since mat_eps[m][k] - mat_eps[m][n] = mat_eps[n][k], the Y0 belonging to the
+    pair (m, n) depends only on n and the Y1 only on m; so we cache them by
+    those integer indices."""
+    mat_gfs, mat_fbars = mat_gfs[:, None, None], mat_fbars[:, None, None]
+    # Y0[w][n][m][a] = -sum_k f[m][k] phi[w][n][k] fbar[k][a] - im0[m][a]
+    aug_f = mat_gfs * mat_phis[:, :, :, None, :]
+    Y0 = -numpy.matmul(aug_f, mat_fbars).sum(axis=0) - im0
+    # Y1[w][m][b][n] = sum_k fbar[b][k] f[k][n] phi[w][k][m]
+    aug_f = mat_gfs * mat_phis.transpose((0, 1, 3, 2))[:, :, :, :, None]
+    Y1 = numpy.matmul(mat_fbars, aug_f).sum(axis=0)
+    # Y[m][n][a][b] = delta[b][n] Y0[m][a] + delta[a][m] Y1[b][n], written along
+    # the diagonals of a (dim, dim, dim, dim) view of each matrix in out.
+    out4 = out.reshape((-1, dim, dim, dim, dim))
+    i, j, k = numpy.ix_(range(0, dim), range(0, dim), range(0, dim))
+    out4[:, i, j, k, j] += Y0.transpose((0, 2, 1, 3))
+    out4[:, i, j, i, k] += Y1.transpose((0, 1, 3, 2))
 
 def tensor_to_matrix(fn, omega):
     return numpy.array(tuple(tuple(
             # upper indices (a, b) increment first if Y^{ab}_{mn} G_{ab} is the product.
-            fn(v / dim, v % dim, u / dim, u % dim, omega)
+            fn(v // dim, v % dim, u // dim, u % dim, omega)
             for v in range(0, dim ** 2))
         for u in range(0, dim ** 2)), dtype=complex)
 
@@ -93,26 +136,74 @@ def mat_from_vec(v):
     return v.reshape((dim, dim))
 
 def mat_eps(ph_energy):
-    return mat_from_fn(lambda m, n: float(ph_energy(m) - ph_energy(n)))
+    """The matrix of energy differences E_m - E_n, from either a function giving
+    E_n or an array of the dim energies."""
+    if type(ph_energy) == numpy.ndarray:
+        return ph_energy[:, None] - ph_energy[None, :]
+    return numpy.ascontiguousarray(
+        mat_from_fn(lambda m, n: ph_energy(m) - ph_energy(n)).real)
 
 def density_of_states(omegas, params=params):
-    """Calculate the density of states for the dot level."""
+    """Calculate the density of states for the dot level.
+
+    If `params['processes']` is given and is not 1, the omegas are split among
+    that many worker processes (all of the CPUs if it is None). The workers must
+    be forked, so where the fork start method is unavailable, or when this is
+    already running inside such a sweep, the omegas are computed serially."""
+    global _sweep_args
     mat_E = mat_eps(params['ph_energy'])
-    smat_E = numpy.diag(mat_E.reshape(dim ** 2))
-    e0 = params['e_level']
-    if params.get('postprocess') != None:
-        mat_pp = mat_from_fn(params['postprocess'])
+    # the diagonal of e0 + smat_E, subtracted from w in place for each omega.
+    vec_E0 = params['e_level'] + mat_E.reshape(dim ** 2)
+    if params.get('postprocess') is not None:
+        # trace(mat_pp.dot(mat_A)) is the plain dot product of this with vec_A.
+        vec_ppT = vec_from_mat(mat_from_fn(params['postprocess']).T)
     else:
-        mat_pp = numpy.diag(numpy.ones(dim))
+        vec_ppT = None
     rho_b = mat_from_fn(params['ph_state'])
     rho_b /= rho_b.trace()
-    @numpy.vectorize
-    def calc(w):
-        smat_Y_w = smat_Y(w, mat_E, params['leads'])
-        mat_A = mat_from_vec(numpy.linalg.solve(
-            numpy.diag((w - e0) * numpy.ones(dim**2)) - smat_E - smat_Y_w,
-            vec_from_mat(rho_b)
-        ))
-        return -2 * (mat_pp.dot(mat_A).trace().imag)
-    return calc(omegas)
+    args = (mat_E, vec_E0, stack_leads(params['leads']), vec_ppT,
+        vec_from_mat(rho_b))
+    ws = numpy.ravel(omegas)
+    # the omegas are solved in batches, each of which fits in chunk_bytes.
+    n_chunks = -(-len(ws) * 16 * dim**4 // chunk_bytes)
+    processes = params.get('processes', 1)
+    if _sweep_args is not None or \
+            'fork' not in multiprocessing.get_all_start_methods():
+        processes = 1
+    if processes != 1:
+        n_chunks = max(n_chunks, processes or multiprocessing.cpu_count())
+    chunks = numpy.array_split(ws, max(1, min(n_chunks, len(ws))))
+    if processes == 1:
+        ys = [_calc_chunk(chunk, *args) for chunk in chunks]
+        return numpy.concatenate(ys).reshape(numpy.shape(omegas))
+    # the leads hold lambdas, which cannot be pickled, so forked workers read
+    # the arguments from a module global instead.
+    _sweep_args = args
+    pool = multiprocessing.get_context('fork').Pool(processes)
+    try:
+        ys = pool.map(_calc_sweep, chunks)
+    finally:
+        pool.close()
+        pool.join()
+        _sweep_args = None
+    return numpy.concatenate(ys).reshape(numpy.shape(omegas))
+
+_sweep_args = None
+
+def _calc_sweep(ws):
+    """Run `_calc_chunk` in a worker process for the sweep in `_sweep_args`."""
+    return _calc_chunk(ws, *_sweep_args)
 
+def _calc_chunk(ws, mat_E, vec_E0, leads, vec_ppT, vec_rho):
+    """Calculate the density of states at each of the frequencies ws."""
+    # form (w - e0) I - smat_E - smat_Y in the arrays smat_Y returned.
+    smat_Ms = smat_Y(ws, mat_E, leads)
+    numpy.negative(smat_Ms, out=smat_Ms)
+    smat_Ms.reshape((len(ws), dim**4))[:, ::dim**2 + 1] += ws[:, None] - vec_E0
+    # This is not a Sylvester equation A X + X B = rho_b: the Y0 acting on
+    # column n of X depends on n, and the Y1 acting on row m depends on m,
+    # so there is no Kronecker-sum factorization and we solve densely.
+    vec_As = numpy.linalg.solve(smat_Ms, vec_rho[None, :, None])[:, :, 0]
+    if vec_ppT is None:
+        return -2 * vec_As.reshape((-1, dim, dim)).trace(axis1=1, axis2=2).imag
+    return -2 * vec_As.dot(vec_ppT).imag
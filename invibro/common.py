@@ -6,21 +6,21 @@ in `invibro/__init__.py`.
 """
 
 from decimal import Decimal
-from numpy import exp
+from numpy import arange, asarray, diag, exp, where
 
 def delta(i, j):
     """Calculate matrix elements for an identity operator."""
-    return 1 if i == j else 0
+    return where(i == j, 1, 0)
 
 def annihilator(u, v):
     """
     Calculate matrix elements for the case of the annihilation operator:
         b |n> = sqrt(n) |n - 1>
     """
-    return v ** 0.5 if u == v - 1 else 0.0
+    return where(u == v - 1, v ** 0.5, 0.0)
 
 def x_quadrature(u, v):
-    """Calculate matrix elements for the x-quadrature $b^\dagger + b$."""
+    r"""Calculate matrix elements for the x-quadrature $b^\dagger + b$."""
     return annihilator(u, v) + annihilator(v, u)
 
 def linear_coupling(k):
@@ -36,20 +36,32 @@ def lorentzian(xs, params):
 def harmonic_energies(hf=1.0):
     """Compute energy values for a normal harmonic oscillator; E_n = n * hf."""
     return lambda n: hf * (n + 0.5)
+
+def harmonic_energies_arr(dim, hf=1.0):
+    """The array of the first `dim` values of `harmonic_energies(hf)`."""
+    return hf * (arange(dim) + 0.5)
     
 def thermal_dist(temp, energies):
     """
     The matrix for a thermal distribution with the given energies function. The
     matrix will be normalized later, so here it is presented as unnormalized.
     """
-    return lambda u, v: exp(-energies(u) / temp) if u == v else 0.0
+    return lambda u, v: where(u == v, exp(-energies(u) / temp), 0.0)
+
+def thermal_dist_arr(temp, energies):
+    """The matrix of `thermal_dist` for an array of energies, built directly."""
+    return diag(exp(-asarray(energies) / temp))
+
+_FACTS = [1]
 
 def fact(n, k=0):
     """Compute n factorial, and partial factorials n!/k! = n * n - 1 * ... * k + 1."""
-    prod = 1
-    for i in xrange(k + 1, n + 1):
-        prod *= i
-    return prod
+    if k >= n:
+        return 1
+    # the factorials are memoized exactly, as Python integers.
+    while len(_FACTS) <= n:
+        _FACTS.append(_FACTS[-1] * len(_FACTS))
+    return _FACTS[n] // _FACTS[k]
 
 def sqrt_fact(n, k=0):
     """Compute the square root of n! if 0 <= n < 300 to double precision."""
@@ -3,35 +3,45 @@
 This submodule implements utilities used within invibro itself which are not
 necessarily intended to be exposed to other programs (see `common.py` for the
 ones which actively are). These include calculating the dimensionless
-Fermi-Dirac function and its derivatives; generating integration lattices which
-can scale logarithmically with the integration bounds rather than linearly; and
-serializing numpy floats into base64 strings for inclusion in .py files.
+Fermi-Dirac function and its derivatives, and generating integration lattices
+which can scale logarithmically with the integration bounds rather than
+linearly.
 """
 
-from numpy import linspace, array, log, exp, sinh, cosh, vectorize
-from struct import pack, unpack
-from base64 import b64encode, b64decode
-from zlib import compress, decompress
+import math
+from numpy import linspace, asarray, clip, where, log, exp, sinh, cosh
 
-@vectorize
 def n(x):
     """Calculate the Fermi-Dirac occupation function."""
-    return 1.0 if x.real < -40 else 0.0 if x.real > 40 else \
-            0.5 * exp(-0.5 * x.real) / cosh(0.5 * x.real)
+    x = asarray(x).real
+    x_c = clip(x, -40, 40)
+    return where(x < -40, 1.0, where(x > 40, 0.0,
+        0.5 * exp(-0.5 * x_c) / cosh(0.5 * x_c)))
 
-n.__doc__ = """Calculate the Fermi-Dirac occupation function."""
+def n_scalar(x):
+    """Calculate the Fermi-Dirac occupation function for a single real x.
+
+    This avoids numpy's per-call overhead inside of integrands."""
+    return 1.0 if x < -40 else 0.0 if x > 40 else \
+            0.5 * math.exp(-0.5 * x) / math.cosh(0.5 * x)
 
 def dndx(x):
     """First derivative of the Fermi-Dirac function"""
-    return -0.25 / cosh(x / 2.0) ** 2 if -40 < x.real < 40 else 0.0
+    x = asarray(x).real
+    x_c = clip(x, -40, 40)
+    return where(abs(x) < 40, -0.25 / cosh(x_c / 2.0) ** 2, 0.0)
 
 def d2ndx2(x):
     """Second derivative of the Fermi-Dirac function"""
-    return 0.25 * sinh(x / 2.0) / cosh(x / 2.0) ** 3 if -40 < x.real < 40 else 0.0
+    x = asarray(x).real
+    x_c = clip(x, -40, 40)
+    return where(abs(x) < 40, 0.25 * sinh(x_c / 2.0) / cosh(x_c / 2.0) ** 3, 0.0)
 
 def d3ndx3(x):
     """Third derivative of the Fermi-Dirac function"""
-    return 0.125 * (2.0 - cosh(x)) / cosh(x / 2.0) ** 4 if -40 < x.real < 40 else 0.0
+    x = asarray(x).real
+    x_c = clip(x, -40, 40)
+    return where(abs(x) < 40, 0.125 * (2.0 - cosh(x_c)) / cosh(x_c / 2.0) ** 4, 0.0)
 
 
 def logspace(bound, spacing, shape):
@@ -63,16 +73,3 @@ def logspace(bound, spacing, shape):
     N = int(log(1 + bound / shape) / log(1 + spacing / shape)) + 1
     points = linspace(0.0, 1.0, N)
     return shape * (((1.0 + bound/shape) ** points) - 1)
-
-def str_from_vec(fv):
-    """Convert a vector of numpy floats into a string."""
-    s = b64encode(compress(pack("<%sd" % len(fv), *fv), 9))
-    out = "\n"
-    for i in range(0, len(s), 80):
-        out += s[i : i + 80] + "\n"
-    return out
-
-def vec_from_str(s):
-    """Convert a string made by str_from_vec into a numpy vector."""
-    base = decompress(b64decode(s.replace("\n", "")))
-    return array(unpack("<%sd" % (len(base) / 8), base))
\ No newline at end of file
@@ -6,34 +6,31 @@ ground state has an x-variance of 1.0 (i.e. x is dimensionless).
 """
 
 import invibro
-from invibro.common import lorentzian, linear_coupling, thermal_dist, harmonic_energies
-from numpy import exp, linspace
+from invibro.common import lorentzian, linear_coupling, thermal_dist_arr, \
+    harmonic_energies_arr
+from numpy import arange, exp, linspace
 from datetime import datetime
-import Gnuplot
+from matplotlib import pyplot
 
 invibro.dim = 30
 
 def plot(xs, ys, ref, name):
-    g = Gnuplot.Gnuplot()
-    #g('set xtics 1,0.5,3')
-    g('set size 0.6,0.6')
+    fig, ax = pyplot.subplots(figsize=(6.0, 4.2))
     if max(ref) > 10:
-        g('set yrange [0:20]')
-        g('set ytics 0,5,20')
-    g.plot(
-        Gnuplot.Data(xs, ref, **{'with': 'lines lt 2 lc rgbcolor "blue" lw 2'}),
-        Gnuplot.Data(xs, ys, **{'with': 'lines lt 1 lc rgbcolor "red" lw 2'})
-    )
-    g.hardcopy(name, color=1, terminal='postscript')
+        ax.set_yticks(arange(0, 21, 5))
+        ax.set_ylim(0, 20)
+    ax.plot(xs, ref, '--', color='blue', lw=2)
+    ax.plot(xs, ys, '-', color='red', lw=2)
+    fig.savefig(name)
+    pyplot.close(fig)
     print("File printed to %s" % name)
 
 kelvin = 8.6173423e-5 * 1000 # meV
 n = 1
-from matplotlib import pyplot
 for k in (1.0, 0.1, 0.05):
     xs = linspace(-4.0, 4.0, 2000) if k == 1.0 else linspace(-2.0, 2.0, 2000)
     T = 5.2 * kelvin
-    energies = harmonic_energies(hf=0.5)
+    energies = harmonic_energies_arr(invibro.dim, hf=0.5)
     print("calc %s" % n); n += 1
     t0 = datetime.utcnow()
     calc = {
@@ -43,7 +40,7 @@ for k in (1.0, 0.1, 0.05):
         ],
         'e_level': 0.0,
         'ph_energy': energies,
-        'ph_state': thermal_dist(T, energies)
+        'ph_state': thermal_dist_arr(T, energies)
     }
     ref = lorentzian(xs, calc)
     ys = invibro.density_of_states(xs, calc)